@@ -4,37 +4,291 @@ Transforms HTML content while preserving similar styling
 """
 
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 import re
 import logging
-from typing import Optional, Dict, Tuple
-import markdown
+import hashlib
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from html import escape as escape_html
+from itertools import chain
+try:
+    # Linear-time matching for user-supplied content when available
+    import re2 as _re
+except ImportError:
+    import re as _re
+from types import MappingProxyType
+from typing import Optional, Dict, Iterator, Mapping, Tuple
+import mistune
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer, get_lexer_by_name
+from pygments.util import ClassNotFound
 import httpx
 import json
+import orjson
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="HTML Transformer", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the CPU worker pool and release shared resources on shutdown"""
+    # Parsing, detection and rendering run here so they do not block the
+    # event loop. Created per startup so a restarted app gets a live pool.
+    app.state.cpu_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    try:
+        yield
+    finally:
+        await transformer.aclose()
+        app.state.cpu_pool.shutdown(wait=False)
+        app.state.cpu_pool = None
+
+
+async def run_cpu_bound(func, *args):
+    """Run a blocking transformer call on the worker pool"""
+    # Without a lifespan (e.g. app mounted elsewhere) use the loop's default executor
+    pool = getattr(app.state, 'cpu_pool', None)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+class OrjsonResponse(JSONResponse):
+    """JSON response encoded with orjson, much faster on the large HTML strings we return"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(
+    title="HTML Transformer",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=OrjsonResponse
+)
 
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Parser for source HTML, which is only read for its styles. Dropping
+# comments and blank text shrinks the tree walked by the XPath queries
+# below; target content is never parsed with this.
+_SOURCE_HTML_PARSER = lxml.html.HTMLParser(
+    remove_comments=True, remove_blank_text=True, encoding='utf-8'
+)
+
+# Parser for target HTML on the streaming path; keeps the content as authored
+_TARGET_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+# A doctype is only honoured ahead of any content, optionally after comments
+_LEADING_DOCTYPE_RE = re.compile(r'\s*(?:<!--.*?-->\s*)*<!doctype', re.IGNORECASE | re.DOTALL)
+
+# XPath queries used for style extraction, compiled once at import
+_STYLED_ELEMENTS_XPATH = etree.XPath('//*[@style]')
+_STYLE_TAGS_XPATH = etree.XPath('//style')
+# Attribute values come back as plain str (no back-reference to the element)
+_CLASS_VALUES_XPATH = etree.XPath('//@class', smart_strings=False)
+_ID_VALUES_XPATH = etree.XPath("//@id[. != '']", smart_strings=False)
+
+# Common Markdown patterns, unioned so each line is scanned once.
+# Classes are spelled out in ASCII ([ \t\r\f\v] is "whitespace other than
+# newline", [0-9] a digit): \s and \d are Unicode-aware under re but
+# ASCII-only under re2, and detection must not depend on which is installed.
+# Bracketed spans use negated classes rather than .+ so a long line that
+# does not match fails in linear time instead of backtracking.
+# MULTILINE is set inline since re2 has no flags argument.
+_MD_DETECT_RE = _re.compile(
+    r'(?m)^(?:'
+    r'#{1,6}[ \t\r\f\v]+'  # Headers
+    r'|\*{1,2}[^*\n]+\*{1,2}$'  # Bold/italic
+    r'|\*[ \t\r\f\v]+.+'  # Unordered list
+    r'|[0-9]+\.[ \t\r\f\v]+.+'  # Ordered list
+    r'|[ \t\r\f\v]*>[ \t\r\f\v]+.+'  # Blockquote
+    r'|[ \t\r\f\v]*```'  # Code block
+    r'|[ \t\r\f\v]*-{3,}'  # Horizontal rule
+    r'|.*?(?:'
+    r'\[[^\[\]\n]+\]\([^()\n]+\)'  # Link
+    r'|!\[[^\[\]\n]*\]\([^()\n]+\)'  # Image
+    r'|`[^`\n]+`'  # Inline code
+    r'))'
+)
+
+# Leading lines checked for unambiguous Markdown before the full scan
+STRONG_SIGNAL_LINES = 5
+
+
+# Whitespace other than newline, as [ \t\r\f\v] in _MD_DETECT_RE
+_LINE_SPACE = ' \t\r\f\v'
+
+
+def _is_strong_markdown_line(line: str) -> bool:
+    """Cheap check for a heading, code fence or blockquote line"""
+    # Only ASCII whitespace counts, as in _MD_DETECT_RE: str.isspace() would
+    # also accept e.g. U+3000 and make the result depend on the pattern
+    stripped = line.lstrip(_LINE_SPACE)
+    if stripped.startswith('```'):
+        return True
+    if stripped.startswith('>'):
+        return stripped[1:2] != '' and stripped[1] in _LINE_SPACE
+    hashes = len(line) - len(line.lstrip('#'))
+    return 1 <= hashes <= 6 and line[hashes:hashes + 1] != '' and line[hashes] in _LINE_SPACE
+
+
+# Line rules for the plain text to Markdown fallback
+_BULLET_RE = re.compile(r'^[•\-*][^\S\n]*(.*)$', re.MULTILINE)
+# Lines under 50 characters that are neither bullets nor numbered items
+_SHORT_LINE_RE = re.compile(r'^(?!\d+\.\s)[^\n•*\-][^\n]{0,48}$', re.MULTILINE)
+
+class _HighlightRenderer(mistune.HTMLRenderer):
+    """HTML renderer that syntax-highlights fenced code with Pygments"""
+    
+    def block_code(self, code: str, info: Optional[str] = None) -> str:
+        # Unlabelled, unknown-language and indented blocks still get the
+        # codehilite wrapper, as Python-Markdown's codehilite gave them
+        lexer = _lexer_for(info.split(None, 1)[0]) if info else None
+        return highlight(code, lexer or _PLAIN_LEXER, _CODE_FORMATTER)
+
+
+@lru_cache(maxsize=64)
+def _lexer_for(language: str):
+    """Pygments lexer for a fence language, looked up once per language"""
+    try:
+        return get_lexer_by_name(language, stripall=True)
+    except ClassNotFound:
+        return None
+
+
+_SLUG_STRIP_RE = re.compile(r'[^\w\s-]')
+_SLUG_SEPARATOR_RE = re.compile(r'[-\s]+')
+
+
+_ID_COUNT_RE = re.compile(r'^(.*)_([0-9]+)$')
+
+
+def _heading_slug(text: str) -> str:
+    """Anchor id for a heading, e.g. 'Getting Started' -> 'getting-started'"""
+    slug = _SLUG_STRIP_RE.sub('', text).strip().lower()
+    return _SLUG_SEPARATOR_RE.sub('-', slug)
+
+
+def _unique_id(slug: str, used_ids: set) -> str:
+    """Suffix a repeated or empty id as Python-Markdown's toc did: x, x_1, x_2"""
+    while slug in used_ids or not slug:
+        match = _ID_COUNT_RE.match(slug)
+        if match:
+            slug = f'{match.group(1)}_{int(match.group(2)) + 1}'
+        else:
+            slug = f'{slug}_1'
+    used_ids.add(slug)
+    return slug
+
+
+def _add_heading_ids(tokens: list, used_ids: set) -> None:
+    """Set the id of every heading token, recursing into container blocks"""
+    for token in tokens:
+        if token['type'] == 'heading':
+            token['attrs']['id'] = _unique_id(_heading_slug(token['text']), used_ids)
+        elif 'children' in token:
+            # Headings nested in blockquotes and lists
+            _add_heading_ids(token['children'], used_ids)
+
+
+def _heading_ids_hook(md: mistune.Markdown, state: mistune.BlockState) -> None:
+    """Give every heading an id unique within the rendered document"""
+    _add_heading_ids(state.tokens, set())
+
+
+# Markdown renderer built once at import rather than per request. Raw HTML
+# is passed through (escape=False) as Python-Markdown did.
+_CODE_FORMATTER = HtmlFormatter(cssclass='codehilite')
+_PLAIN_LEXER = TextLexer(stripall=True)
+_render_markdown = mistune.create_markdown(
+    escape=False,
+    renderer=_HighlightRenderer(escape=False),
+    plugins=['table', 'strikethrough', 'footnotes']
+)
+_render_markdown.before_render_hooks.append(_heading_ids_hook)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Upper bound on the body size read from a fetched URL
+MAX_FETCH_BYTES = 5_000_000
+
+# Processing strategy descriptions by content type
+PROCESSING_STRATEGIES = {
+    "markdown": "Markdown to HTML conversion with syntax highlighting",
+    "plain_text": "Plain text to HTML paragraphs conversion",
+    "empty": "Empty content detected"
+}
+
+# Number of transform results kept for repeated identical requests, and
+# the total transformed HTML (in characters) they may hold. Results larger
+# than the whole budget are not cached.
+TRANSFORM_CACHE_SIZE = 256
+TRANSFORM_CACHE_MAX_CHARS = 32_000_000
+
+# Number of extracted source style sets kept, for transforming many
+# targets against the same source, and the total style text (in characters)
+# they may hold. Style sets larger than the whole budget are not cached.
+STYLES_CACHE_SIZE = 64
+STYLES_CACHE_MAX_CHARS = 8_000_000
+
+
+def _content_digest(text: str) -> bytes:
+    """Fixed-size cache key for arbitrarily large input text"""
+    return hashlib.blake2b(
+        text.encode('utf-8', 'surrogatepass'), digest_size=16
+    ).digest()
+
+
+def _freeze_styles(styles: dict) -> Mapping:
+    """Read-only copy of extract_styles() output, safe to share between requests"""
+    return MappingProxyType({
+        'inline_styles': MappingProxyType({
+            tag_name: tuple(styles_list)
+            for tag_name, styles_list in styles['inline_styles'].items()
+        }),
+        'css_rules': tuple(styles['css_rules']),
+        'classes': frozenset(styles['classes']),
+        'ids': frozenset(styles['ids'])
+    })
+
+
+def _styles_size(styles: Mapping) -> int:
+    """Characters of style text held by a frozen style set"""
+    return (
+        sum(map(len, styles['css_rules']))
+        + sum(len(style) for styles_list in styles['inline_styles'].values() for style in styles_list)
+        + sum(map(len, styles['classes']))
+        + sum(map(len, styles['ids']))
+    )
+
 
 class HTMLTransformer:
     """Core HTML transformation logic"""
     
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Shared async HTTP client, created on first fetch
+        self._client: Optional[httpx.AsyncClient] = None
+        # LRU of transform results keyed by (source digest, target digest, content_type)
+        self._transform_cache = OrderedDict()
+        self._transform_cache_chars = 0
+        # LRU of frozen source styles keyed by source digest
+        self._styles_cache = OrderedDict()
+        self._styles_cache_chars = 0
+        # transform_html runs on worker threads, so guard the caches
+        self._cache_lock = threading.Lock()
     
     def detect_content_type(self, content: str) -> Tuple[str, str]:
         """
@@ -44,35 +298,21 @@ class HTMLTransformer:
         if not content.strip():
             return "empty", ""
         
-        # Common Markdown patterns
-        markdown_patterns = [
-            r'^#{1,6}\s+',  # Headers
-            r'^\*{1,2}.+\*{1,2}$',  # Bold/italic
-            r'^\*\s+.+',  # Unordered list
-            r'^\d+\.\s+.+',  # Ordered list
-            r'^\s*>\s+.+',  # Blockquote
-            r'^\s*```',  # Code block
-            r'^\s*-{3,}',  # Horizontal rule
-            r'\[.+\]\(.+\)',  # Link
-            r'!\[.*\]\(.+\)',  # Image
-            r'`[^`]+`',  # Inline code
-        ]
+        # A heading, fence or quote near the top settles it without a full scan
+        leading_lines = content.split('\n', STRONG_SIGNAL_LINES)[:STRONG_SIGNAL_LINES]
+        if any(_is_strong_markdown_line(line) for line in leading_lines):
+            return "markdown", content
         
+        # If more than 20% of non-empty lines match Markdown patterns, consider it Markdown.
+        # Each line contributes at most one match: every alternative is
+        # anchored at a line start and none of them crosses a newline
+        non_empty_lines = sum(1 for line in content.split('\n') if line.strip())
         markdown_score = 0
-        lines = content.split('\n')
-        
-        for line in lines:
-            if not line.strip():
-                continue
-            for pattern in markdown_patterns:
-                if re.search(pattern, line, re.MULTILINE):
-                    markdown_score += 1
-                    break
-        
-        # If more than 20% of non-empty lines match Markdown patterns, consider it Markdown
-        non_empty_lines = [line for line in lines if line.strip()]
-        if non_empty_lines and (markdown_score / len(non_empty_lines)) > 0.2:
-            return "markdown", content
+        for _ in _MD_DETECT_RE.finditer(content):
+            markdown_score += 1
+            # score / non_empty_lines > 0.2, kept in integers
+            if markdown_score * 5 > non_empty_lines:
+                return "markdown", content
         
         return "plain_text", content
     
@@ -92,39 +332,71 @@ class HTMLTransformer:
         
         return '\n'.join(html_lines)
     
-    def process_target_content(self, content: str) -> Tuple[str, str]:
+    def process_target_content(self, content: str, content_type: Optional[str] = None) -> Tuple[str, str, str]:
         """
         Process target content based on its type
-        Returns: (content_type, processed_html)
+        Pass content_type when it is already known to skip detection
+        Returns: (content_type, markdown_source, processed_html)
         """
-        content_type, processed_content = self.detect_content_type(content)
+        if content_type is None:
+            content_type, processed_content = self.detect_content_type(content)
+        else:
+            processed_content = content
         
         if content_type == "markdown":
             # Convert Markdown to HTML
-            html_content = markdown.markdown(
-                processed_content,
-                extensions=['tables', 'fenced_code', 'codehilite', 'toc']
-            )
-            return "markdown", html_content
+            html_content = _render_markdown(processed_content)
+            return "markdown", processed_content, html_content
         elif content_type == "plain_text":
             # Note: For the transform endpoint, we'll handle API calls at the route level
             # This method is kept for backward compatibility but should not be used for plain text
             html_content = self.convert_plain_text_to_html_paragraphs(processed_content)
-            return "plain_text", html_content
+            return "plain_text", processed_content, html_content
         else:
-            return "empty", ""
+            return "empty", "", ""
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client so connections are pooled across requests"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': USER_AGENT},
+                timeout=10,
+                follow_redirects=True
+            )
+        return self._client
     
-    def fetch_html_from_url(self, url: str) -> str:
+    async def aclose(self):
+        """Close the shared HTTP client if one was created"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def fetch_html_from_url(self, url: str) -> str:
         """Translate page style from a given URL"""
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
+            # Stream the body so oversized pages are cut off at MAX_FETCH_BYTES
+            chunks = []
+            received = 0
+            async with self.client.stream('GET', url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    chunks.append(chunk[:MAX_FETCH_BYTES - received])
+                    received += len(chunk)
+                    if received >= MAX_FETCH_BYTES:
+                        logger.warning(f"Truncated {url} at {MAX_FETCH_BYTES} bytes")
+                        break
+            body = b''.join(chunks)
+            try:
+                return body.decode(response.charset_encoding or 'utf-8', errors='replace')
+            except LookupError:
+                # Unknown charset in the Content-Type header
+                return body.decode('utf-8', errors='replace')
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
             logger.error(f"Error fetching URL {url}: {e}")
             raise HTTPException(status_code=400, detail=f"Error fetching URL: {str(e)}")
     
-    def extract_styles(self, soup: BeautifulSoup) -> dict:
+    def extract_styles(self, source_html: str) -> dict:
         """Extract CSS styles from HTML"""
         styles = {
             'inline_styles': {},
@@ -133,63 +405,153 @@ class HTMLTransformer:
             'ids': set()
         }
         
+        try:
+            # Bytes in, so pages carrying an XML encoding declaration still parse
+            root = lxml.html.fromstring(source_html.encode('utf-8'), parser=_SOURCE_HTML_PARSER)
+        except etree.ParserError:
+            # Nothing parseable (e.g. whitespace or comments only)
+            return styles
+        
         # Extract inline styles
-        for element in soup.find_all(attrs={'style': True}):
-            tag_name = element.name
+        for element in _STYLED_ELEMENTS_XPATH(root):
+            tag_name = element.tag
             if tag_name not in styles['inline_styles']:
                 styles['inline_styles'][tag_name] = []
             styles['inline_styles'][tag_name].append(element.get('style'))
         
         # Extract CSS from style tags
-        for style_tag in soup.find_all('style'):
-            if style_tag.string:
-                styles['css_rules'].append(style_tag.string)
+        for style_tag in _STYLE_TAGS_XPATH(root):
+            if style_tag.text:
+                styles['css_rules'].append(style_tag.text)
         
         # Extract classes and IDs
-        for element in soup.find_all():
-            if element.get('class'):
-                styles['classes'].update(element.get('class'))
-            if element.get('id'):
-                styles['ids'].add(element.get('id'))
+        styles['classes'].update(
+            chain.from_iterable(value.split() for value in _CLASS_VALUES_XPATH(root))
+        )
+        styles['ids'].update(_ID_VALUES_XPATH(root))
+        
+        return styles
+    
+    def get_source_styles(self, source_html: str) -> Mapping:
+        """Styles of source_html as a read-only mapping, cached by content digest"""
+        key = _content_digest(source_html)
+        with self._cache_lock:
+            styles = self._styles_cache.get(key)
+            if styles is not None:
+                self._styles_cache.move_to_end(key)
+                return styles
         
+        styles = _freeze_styles(self.extract_styles(source_html))
+        self._store_source_styles(key, styles)
         return styles
     
-    def transform_html(self, source_html: str, target_content: str) -> Dict[str, str]:
-        """Transform target content to match source styling"""
-        source_soup = BeautifulSoup(source_html, 'html.parser')
+    def _store_source_styles(self, key: bytes, styles: Mapping) -> None:
+        """Add a style set to the LRU, evicting by entry count and total style size"""
+        size = _styles_size(styles)
+        if size > STYLES_CACHE_MAX_CHARS:
+            return
+        with self._cache_lock:
+            previous = self._styles_cache.pop(key, None)
+            if previous is not None:
+                self._styles_cache_chars -= _styles_size(previous)
+            self._styles_cache[key] = styles
+            self._styles_cache_chars += size
+            while (len(self._styles_cache) > STYLES_CACHE_SIZE
+                   or self._styles_cache_chars > STYLES_CACHE_MAX_CHARS):
+                _, evicted = self._styles_cache.popitem(last=False)
+                self._styles_cache_chars -= _styles_size(evicted)
+    
+    def transform_html(
+        self, source_html: str, target_content: str, content_type: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Transform target content to match source styling
+        content_type may be passed if the caller already detected it
+        """
+        # A caller-supplied content_type can differ from what detection would
+        # pick, so it is part of the key
+        key = (_content_digest(source_html), _content_digest(target_content), content_type)
+        with self._cache_lock:
+            cached = self._transform_cache.get(key)
+            if cached is not None:
+                self._transform_cache.move_to_end(key)
+        if cached is None:
+            cached = self._transform_html_uncached(source_html, target_content, content_type)
+            self._store_transform_result(key, cached)
         
+        # The input echoes are added per call rather than cached, so the cache
+        # never pins the (possibly multi-MB) request bodies. Non-empty content
+        # is passed through process_target_content unchanged.
+        return {
+            **cached,
+            "original_content": target_content,
+            "processed_markdown": "" if cached["content_type"] == "empty" else target_content
+        }
+    
+    def _store_transform_result(self, key: tuple, result: Dict[str, str]) -> None:
+        """Add a result to the LRU, evicting by entry count and total HTML size"""
+        size = len(result["transformed_html"])
+        if size > TRANSFORM_CACHE_MAX_CHARS:
+            return
+        with self._cache_lock:
+            previous = self._transform_cache.pop(key, None)
+            if previous is not None:
+                self._transform_cache_chars -= len(previous["transformed_html"])
+            self._transform_cache[key] = result
+            self._transform_cache_chars += size
+            while (len(self._transform_cache) > TRANSFORM_CACHE_SIZE
+                   or self._transform_cache_chars > TRANSFORM_CACHE_MAX_CHARS):
+                _, evicted = self._transform_cache.popitem(last=False)
+                self._transform_cache_chars -= len(evicted["transformed_html"])
+    
+    def _transform_html_uncached(
+        self, source_html: str, target_content: str, content_type: Optional[str]
+    ) -> Dict[str, str]:
+        """Parse, extract and apply styles without consulting the cache"""
         # Process target content based on its type
-        content_type, processed_html = self.process_target_content(target_content)
-        target_soup = BeautifulSoup(processed_html, 'html.parser')
+        content_type, _, processed_html = self.process_target_content(
+            target_content, content_type
+        )
         
         # Extract styles from source
-        source_styles = self.extract_styles(source_soup)
+        source_styles = self.get_source_styles(source_html)
         
-        # Apply similar styling to target
-        transformed_soup = self.apply_similar_styling(target_soup, source_styles)
+        # Apply similar styling to target. The content is parsed even when
+        # there is nothing to apply, so the result is always a full document.
+        target_soup = BeautifulSoup(processed_html, 'lxml')
+        transformed_html = str(self.apply_similar_styling(target_soup, source_styles))
         
         return {
-            "transformed_html": str(transformed_soup),
+            "transformed_html": transformed_html,
             "content_type": content_type,
             "processing_strategy": self.get_processing_strategy(content_type)
         }
     
     def get_processing_strategy(self, content_type: str) -> str:
         """Get the processing strategy description based on content type"""
-        strategies = {
-            "markdown": "Markdown to HTML conversion with syntax highlighting",
-            "plain_text": "Plain text to HTML paragraphs conversion",
-            "empty": "Empty content detected"
+        return PROCESSING_STRATEGIES.get(content_type, "Unknown content type")
+    
+    def plan_styling(self, source_styles: Mapping) -> Tuple[Optional[str], Dict[str, str]]:
+        """
+        Decide what styling to copy from source to target, independent of tree API
+        Returns: (css_text or None, {tag_name: most common inline style})
+        """
+        css_text = '\n'.join(source_styles['css_rules']) if source_styles['css_rules'] else None
+        tag_styles = {
+            tag_name: Counter(styles_list).most_common(1)[0][0]
+            for tag_name, styles_list in source_styles['inline_styles'].items()
+            if styles_list
         }
-        return strategies.get(content_type, "Unknown content type")
+        return css_text, tag_styles
     
-    def apply_similar_styling(self, target_soup: BeautifulSoup, source_styles: dict) -> BeautifulSoup:
+    def apply_similar_styling(self, target_soup: BeautifulSoup, source_styles: Mapping) -> BeautifulSoup:
         """Apply similar styling from source to target HTML"""
+        css_text, tag_styles = self.plan_styling(source_styles)
         
         # Create a style tag with extracted CSS
-        if source_styles['css_rules']:
+        if css_text is not None:
             style_tag = target_soup.new_tag('style')
-            style_tag.string = '\n'.join(source_styles['css_rules'])
+            style_tag.string = css_text
             
             # Add to head or create head if it doesn't exist
             if not target_soup.head:
@@ -201,16 +563,112 @@ class HTMLTransformer:
             
             target_soup.head.append(style_tag)
         
-        # Apply inline styles to similar elements
-        for tag_name, styles_list in source_styles['inline_styles'].items():
-            target_elements = target_soup.find_all(tag_name)
-            if target_elements and styles_list:
-                # Use the most common style for this tag
-                most_common_style = max(set(styles_list), key=styles_list.count)
-                for element in target_elements:
-                    element['style'] = most_common_style
+        # Apply the most common inline style of each tag to similar elements
+        for tag_name, style in tag_styles.items():
+            for element in target_soup.find_all(tag_name):
+                element['style'] = style
         
         return target_soup
+    
+    def iter_transformed_html(
+        self, source_html: str, target_content: str, content_type: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """
+        Transform target content like transform_html, returning UTF-8 chunks
+        Parsing and styling happen here, before the first chunk is requested,
+        so errors surface to the caller. Only serialization is deferred: the
+        styled lxml tree is written out one body child at a time, so the full
+        document string is never built
+        """
+        content_type, _, processed_html = self.process_target_content(
+            target_content, content_type
+        )
+        if not processed_html.strip():
+            return iter(())
+        
+        source_styles = self.get_source_styles(source_html)
+        # Parsed even without styles to apply, giving the same full document
+        # shape as transform_html. Bytes in, so an XML encoding declaration in the content still parses
+        root = lxml.html.document_fromstring(
+            processed_html.encode('utf-8'), parser=_TARGET_HTML_PARSER
+        )
+        self.apply_similar_styling_to_tree(root, source_styles)
+        
+        # Everything beyond serializing parsed nodes is computed here, so the
+        # iterator handed to StreamingResponse has nothing left that can fail.
+        # lxml reports an implied doctype, so only keep one the content declared
+        doctype = None
+        if _LEADING_DOCTYPE_RE.match(processed_html):
+            doctype = root.getroottree().docinfo.doctype.encode('utf-8') + b'\n'
+        body = root.find('body')
+        body_start = _start_tag(body) + _escape_text(body.text) if body is not None else b''
+        html_start = _start_tag(root) + _escape_text(root.text)
+        return _iter_document_chunks(root, doctype, html_start, body_start)
+    
+    def apply_similar_styling_to_tree(self, root: lxml.html.HtmlElement, source_styles: Mapping) -> None:
+        """Apply similar styling from source to an lxml document in place"""
+        css_text, tag_styles = self.plan_styling(source_styles)
+        
+        # Create a style tag with extracted CSS
+        if css_text is not None:
+            head = root.find('head')
+            if head is None:
+                head = etree.Element('head')
+                root.insert(0, head)
+            style_tag = etree.SubElement(head, 'style')
+            style_tag.text = css_text
+        
+        # Apply the most common inline style of each tag to similar elements
+        for tag_name, style in tag_styles.items():
+            for element in root.iter(tag_name):
+                element.set('style', style)
+
+
+def _serialize_node(node) -> bytes:
+    """HTML for an element, comment or PI, including its tail text"""
+    return etree.tostring(node, method='html', encoding='utf-8')
+
+
+def _start_tag(element: lxml.html.HtmlElement) -> bytes:
+    """
+    Opening tag of an element with its attributes
+    Built by hand: etree.Element() rejects names the HTML parser accepts (xml:lang)
+    """
+    attributes = ''.join(f' {name}="{escape_html(value)}"' for name, value in element.items())
+    return f'<{element.tag}{attributes}>'.encode('utf-8')
+
+
+def _escape_text(text: Optional[str]) -> bytes:
+    return escape_html(text or '', quote=False).encode('utf-8')
+
+
+def _iter_document_chunks(
+    root: lxml.html.HtmlElement, doctype: Optional[bytes], html_start: bytes, body_start: bytes
+) -> Iterator[bytes]:
+    """
+    Serialize a parsed document piecewise, matching str() of the same soup
+    doctype and the <html>/<body> start tags (with their leading text) are
+    prepared by the caller
+    """
+    if doctype is not None:
+        yield doctype
+    # Comments and processing instructions before <html>
+    for node in reversed(list(root.itersiblings(preceding=True))):
+        yield _serialize_node(node)
+    
+    yield html_start
+    for child in root:
+        if child.tag == 'body':
+            yield body_start
+            for grandchild in child:
+                yield _serialize_node(grandchild)
+            yield b'</body>' + _escape_text(child.tail)
+        else:
+            yield _serialize_node(child)
+    yield b'</html>'
+    
+    for node in root.itersiblings():
+        yield _serialize_node(node)
 
 
 # Initialize transformer
@@ -284,29 +742,21 @@ def basic_text_to_markdown_fallback(text: str) -> str:
     """
     logger.info("Using basic fallback for text-to-markdown conversion")
     
-    lines = text.split('\n')
-    markdown_lines = []
-    
-    for line in lines:
-        stripped_line = line.strip()
-        if not stripped_line:
-            markdown_lines.append("")  # Preserve empty lines
-            continue
-        
-        # Convert numbered lists
-        if re.match(r'^\d+\.\s+', stripped_line):
-            markdown_lines.append(stripped_line)
-        # Convert bullet points
-        elif stripped_line.startswith('•') or stripped_line.startswith('-') or stripped_line.startswith('*'):
-            markdown_lines.append(f"- {stripped_line[1:].strip()}")
-        # Convert potential headers (all caps or short lines)
-        elif len(stripped_line) < 50 and stripped_line.isupper():
-            markdown_lines.append(f"## {stripped_line.title()}")
-        # Regular paragraph
-        else:
-            markdown_lines.append(stripped_line)
-    
-    return '\n'.join(markdown_lines)
+    # Strip lines with str.strip(): a regex for trailing whitespace retries
+    # at every position of a long inner whitespace run and goes quadratic.
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    # The remaining rules are one substitution each over the whole text.
+    # Numbered lists are left as they are.
+    # Convert bullet points
+    text = _BULLET_RE.sub(r'- \1', text)
+    # Convert potential headers (all caps or short lines)
+    return _SHORT_LINE_RE.sub(_upper_line_to_header, text)
+
+
+def _upper_line_to_header(match: re.Match) -> str:
+    """Turn an all-caps short line into a level-two header"""
+    line = match.group(0)
+    return f"## {line.title()}" if line.isupper() else line
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -319,7 +769,7 @@ async def index(request: Request):
 async def fetch_url(url: str = Form(...)):
     """Translate page style from a given URL"""
     try:
-        html_content = transformer.fetch_html_from_url(url)
+        html_content = await transformer.fetch_html_from_url(url)
         return {"success": True, "html": html_content}
     except HTTPException as e:
         return {"success": False, "error": str(e.detail)}
@@ -332,7 +782,7 @@ async def process_source_text(source_text: str = Form(...)):
         if not source_text.strip():
             return {"success": False, "error": "Source text is required"}
         
-        content_type, _ = transformer.detect_content_type(source_text)
+        content_type, _ = await run_cpu_bound(transformer.detect_content_type, source_text)
         
         if content_type == "markdown":
             # Already markdown, return as is
@@ -340,7 +790,6 @@ async def process_source_text(source_text: str = Form(...)):
         elif content_type == "plain_text":
             # Convert plain text to markdown using external API
             # Determine mode from environment variable, default to "pro"
-            import os
             mode = os.getenv("APP_MODE", "pro")
             processed_content = await convert_text_to_markdown_api(source_text, mode)
         else:
@@ -368,23 +817,21 @@ async def transform_html(
             return {"success": False, "error": "Both source HTML and target content are required"}
         
         # Detect content type and handle plain text with API
-        content_type, _ = transformer.detect_content_type(target_content)
+        content_type, _ = await run_cpu_bound(transformer.detect_content_type, target_content)
         
         if content_type == "plain_text":
             # Convert plain text to markdown using external API
             # Determine mode from environment variable, default to "test"
-            import os
             mode = os.getenv("APP_MODE", "test")
             markdown_content = await convert_text_to_markdown_api(target_content, mode)
             # Now transform the markdown content
-            result = transformer.transform_html(source_html, markdown_content)
+            result = await run_cpu_bound(transformer.transform_html, source_html, markdown_content)
             result["original_content"] = target_content
-            result["processed_markdown"] = markdown_content
         else:
-            # Handle markdown content normally
-            result = transformer.transform_html(source_html, target_content)
-            result["original_content"] = target_content
-            result["processed_markdown"] = target_content
+            # Handle markdown content normally, reusing the detected type
+            result = await run_cpu_bound(
+                transformer.transform_html, source_html, target_content, content_type
+            )
         
         return {"success": True, **result}
     
@@ -393,6 +840,37 @@ async def transform_html(
         return {"success": False, "error": f"Transformation error: {str(e)}"}
 
 
+@app.post("/transform-stream")
+async def transform_html_stream(
+    source_html: str = Form(...),
+    target_content: str = Form(...)
+):
+    """Stream the transformed HTML for large documents instead of wrapping it in JSON"""
+    try:
+        if not source_html.strip() or not target_content.strip():
+            return {"success": False, "error": "Both source HTML and target content are required"}
+        
+        # Detect content type and handle plain text with API, as /transform does
+        content_type, _ = await run_cpu_bound(transformer.detect_content_type, target_content)
+        
+        if content_type == "plain_text":
+            mode = os.getenv("APP_MODE", "test")
+            target_content = await convert_text_to_markdown_api(target_content, mode)
+            # The API output has not been classified yet
+            content_type = None
+        
+        # Parse and style now so failures are reported before streaming starts
+        chunks = await run_cpu_bound(
+            transformer.iter_transformed_html, source_html, target_content, content_type
+        )
+    except Exception as e:
+        logger.error(f"Error transforming HTML: {e}")
+        return {"success": False, "error": f"Transformation error: {str(e)}"}
+    
+    # Serialization is iterated on Starlette's threadpool
+    return StreamingResponse(chunks, media_type="text/html; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file